@@ -3,20 +3,58 @@
 This module allows LLM to review images before deciding whether to send them to users.
 """
 
-import base64
+import asyncio
+import mmap
 import os
+import threading
 import time
+from collections import OrderedDict, defaultdict
 from dataclasses import dataclass, field
 from typing import ClassVar
 
 from astrbot import logger
 from astrbot.core.utils.astrbot_path import get_astrbot_temp_path
 
+try:
+    # Optional SIMD-accelerated base64 codec; falls back to the stdlib.
+    from pybase64 import b64decode as _b64decode
+    from pybase64 import b64encode as _b64encode
+except ImportError:
+    from base64 import b64decode as _b64decode
+    from base64 import b64encode as _b64encode
+
+# Base64 chars per decode chunk; a multiple of 4 so padding never crosses
+# a chunk boundary.
+_B64_CHUNK_SIZE = 64 * 1024
+# Raw bytes per encode chunk; a multiple of 3 so chunks encode without
+# intermediate padding and can be concatenated directly.
+_RAW_CHUNK_SIZE = 48 * 1024
+
+_MIME_TO_EXT = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/bmp": ".bmp",
+    "image/svg+xml": ".svg",
+}
+_EXT_TO_MIME = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".bmp": "image/bmp",
+    ".svg": "image/svg+xml",
+}
+
 
 @dataclass
 class CachedImage:
     """Represents a cached image from a tool call."""
 
+    image_ref: str
+    """Unique reference for this image ("{tool_call_id}_{index}")."""
     tool_call_id: str
     """The tool call ID that produced this image."""
     tool_name: str
@@ -27,6 +65,10 @@ class CachedImage:
     """The MIME type of the image."""
     created_at: float = field(default_factory=time.time)
     """Timestamp when the image was cached."""
+    cached_b64: str | None = field(default=None, repr=False)
+    """Memoized base64 payload, managed by the ToolImageCache LRU."""
+    mapped: mmap.mmap | None = field(default=None, repr=False, compare=False)
+    """Read-only memory map of the file, created on first raw-bytes access."""
 
 
 class ToolImageCache:
@@ -36,36 +78,75 @@ class ToolImageCache:
     """
 
     _instance: ClassVar["ToolImageCache | None"] = None
+    _instance_lock: ClassVar[threading.Lock] = threading.Lock()
     CACHE_DIR_NAME: ClassVar[str] = "tool_images"
     # Cache expiry time in seconds (1 hour)
     CACHE_EXPIRY: ClassVar[int] = 3600
+    # Interval between periodic cleanup sweeps (5 minutes)
+    CLEANUP_INTERVAL_SECONDS: ClassVar[int] = 5 * 60
+    # Total bytes of memoized base64 payloads kept across entries
+    B64_CACHE_MAX_BYTES: ClassVar[int] = 32 * 1024 * 1024
 
     def __new__(cls) -> "ToolImageCache":
+        # Double-checked locking: tool calls may run in worker threads, and
+        # two first-time callers must not both construct the singleton.
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._initialized = False
+                    cls._instance = instance
         return cls._instance
 
     def __init__(self) -> None:
-        if self._initialized:
-            return
-        self._initialized = True
+        with self._instance_lock:
+            if self._initialized:
+                return
+            self._init()
+            self._initialized = True
+
+    def _init(self) -> None:
         self._cache_dir = os.path.join(get_astrbot_temp_path(), self.CACHE_DIR_NAME)
+        # Precomputed with a trailing separator so per-image paths are a
+        # single f-string concat instead of an os.path.join call.
+        self._cache_dir_sep = self._cache_dir + os.sep
         os.makedirs(self._cache_dir, exist_ok=True)
+        # In-memory registry keyed by image_ref, with a secondary index so
+        # per-tool-call lookups are O(k) instead of scanning every entry.
+        self._cache: dict[str, CachedImage] = {}
+        self._by_tool_call: dict[str, list[str]] = defaultdict(list)
+        # Lazily built image_ref -> file_path index of the cache dir, so
+        # registry misses resolve without probing the filesystem per call.
+        self._disk_index: dict[str, str] = {}
+        self._disk_index_built = False
+        # Refs whose file this process wrote (or confirmed) on disk; hits
+        # on these skip the per-lookup existence probe.
+        self._verified: set[str] = set()
+        self._cleanup_stop = asyncio.Event()
+        # LRU of refs with a memoized base64 payload (ref -> payload size),
+        # bounded overall by B64_CACHE_MAX_BYTES.
+        self._b64_lru: OrderedDict[str, int] = OrderedDict()
+        self._b64_cache_bytes = 0
+        # Guards compound mutations of the structures above. Read paths
+        # rely on the GIL-atomicity of single dict operations instead.
+        self._mu = threading.Lock()
+        # Reusable chunk buffer for encoding files, with its own lock so
+        # concurrent encodes don't trample each other.
+        self._read_buf = bytearray(_RAW_CHUNK_SIZE)
+        self._encode_mu = threading.Lock()
         logger.debug(f"ToolImageCache initialized, cache dir: {self._cache_dir}")
 
     def _get_file_extension(self, mime_type: str) -> str:
         """Get file extension from MIME type."""
-        mime_to_ext = {
-            "image/png": ".png",
-            "image/jpeg": ".jpg",
-            "image/jpg": ".jpg",
-            "image/gif": ".gif",
-            "image/webp": ".webp",
-            "image/bmp": ".bmp",
-            "image/svg+xml": ".svg",
-        }
-        return mime_to_ext.get(mime_type.lower(), ".png")
+        # Fast path: callers normally pass canonical lowercase MIME types,
+        # so the .lower() allocation is only paid on the fallback.
+        return _MIME_TO_EXT.get(mime_type) or _MIME_TO_EXT.get(
+            mime_type.lower(), ".png"
+        )
+
+    def _get_mime_type(self, file_path: str) -> str:
+        """Get MIME type from a cached file's extension."""
+        return _EXT_TO_MIME.get(os.path.splitext(file_path)[1].lower(), "image/png")
 
     def save_image(
         self,
@@ -87,26 +168,189 @@ class ToolImageCache:
         Returns:
             CachedImage object with file path.
         """
+        # Models sometimes return a data URL instead of bare base64; strip
+        # the prefix rather than failing deep inside the decoder.
+        if base64_data.startswith("data:"):
+            _header, sep, rest = base64_data.partition(",")
+            if sep:
+                base64_data = rest
+        # Embedded whitespace is legal base64 (MIME wraps lines at 76
+        # chars) but would let a chunk boundary split the valid-character
+        # stream at a non-multiple-of-4 offset, so strip it whenever
+        # present — the total length alone cannot prove its absence.
+        if (
+            "\n" in base64_data
+            or "\r" in base64_data
+            or " " in base64_data
+            or "\t" in base64_data
+        ):
+            base64_data = "".join(base64_data.split())
+        # Reject garbage cheaply before paying for the full decode scan.
+        if len(base64_data) & 3:
+            raise ValueError("Invalid base64 image data: length is not a multiple of 4")
+
         ext = self._get_file_extension(mime_type)
-        file_name = f"{tool_call_id}_{index}{ext}"
-        file_path = os.path.join(self._cache_dir, file_name)
+        image_ref = f"{tool_call_id}_{index}"
+        file_path = f"{self._cache_dir_sep}{image_ref}{ext}"
 
-        # Decode and save the image
+        # Decode and save the image, streaming in bounded chunks so the
+        # full decoded payload is never materialized in memory. Writes go
+        # through a raw fd: each decoded chunk is a single full write, so
+        # the buffered IO stack on top of io.FileIO adds nothing here.
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_CLOEXEC", 0)
         try:
-            image_bytes = base64.b64decode(base64_data)
-            with open(file_path, "wb") as f:
-                f.write(image_bytes)
+            fd = os.open(file_path, flags, 0o644)
+            try:
+                for start in range(0, len(base64_data), _B64_CHUNK_SIZE):
+                    os.write(
+                        fd, _b64decode(base64_data[start : start + _B64_CHUNK_SIZE])
+                    )
+            finally:
+                os.close(fd)
             logger.debug(f"Saved tool image to: {file_path}")
         except Exception as e:
             logger.error(f"Failed to save tool image: {e}")
             raise
 
-        return CachedImage(
+        cached = CachedImage(
+            image_ref=image_ref,
             tool_call_id=tool_call_id,
             tool_name=tool_name,
             file_path=file_path,
             mime_type=mime_type,
         )
+        with self._mu:
+            self._cache[image_ref] = cached
+            refs = self._by_tool_call[tool_call_id]
+            if image_ref not in refs:
+                refs.append(image_ref)
+            self._disk_index[image_ref] = file_path
+            self._verified.add(image_ref)
+        return cached
+
+    def get_image(self, image_ref: str) -> CachedImage | None:
+        """Get a cached image by its reference.
+
+        Registry misses fall back to an index of the cache dir, so images
+        written by a previous process can still be resolved.
+
+        Args:
+            image_ref: The image reference ("{tool_call_id}_{index}").
+
+        Returns:
+            CachedImage if found, None otherwise.
+        """
+        cached = self._cache.get(image_ref)
+        if cached is not None:
+            # Files this module wrote itself are trusted without a syscall;
+            # only unverified entries pay for the existence probe.
+            if image_ref in self._verified:
+                return cached
+            if os.path.exists(cached.file_path):
+                self._verified.add(image_ref)
+                return cached
+            # File vanished from under us; drop the stale entry.
+            with self._mu:
+                self._cache.pop(image_ref, None)
+                self._drop_ref(cached)
+                self._drop_b64(cached)
+                self._close_mapping(cached)
+            return None
+
+        if not self._disk_index_built:
+            self._build_disk_index()
+        file_path = self._disk_index.get(image_ref)
+        if file_path is None:
+            return None
+        if not os.path.isfile(file_path):
+            self._disk_index.pop(image_ref, None)
+            return None
+
+        # Reconstruct a registry entry from the on-disk file.
+        head, sep, _index = image_ref.rpartition("_")
+        tool_call_id = head if sep else image_ref
+        cached = CachedImage(
+            image_ref=image_ref,
+            tool_call_id=tool_call_id,
+            tool_name="",
+            file_path=file_path,
+            mime_type=self._get_mime_type(file_path),
+            created_at=os.path.getmtime(file_path),
+        )
+        with self._mu:
+            cached = self._cache.setdefault(image_ref, cached)
+            refs = self._by_tool_call[cached.tool_call_id]
+            if image_ref not in refs:
+                refs.append(image_ref)
+        return cached
+
+    def _build_disk_index(self) -> None:
+        """Index the cache dir by image_ref (file name without extension)."""
+        index: dict[str, str] = {}
+        try:
+            with os.scandir(self._cache_dir) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        index[os.path.splitext(entry.name)[0]] = entry.path
+        except OSError as e:
+            logger.warning(f"Failed to index tool image cache dir: {e}")
+        self._disk_index = index
+        self._disk_index_built = True
+
+    def list_images_by_tool_call(self, tool_call_id: str) -> list[CachedImage]:
+        """List all cached images produced by a tool call.
+
+        Args:
+            tool_call_id: The tool call ID to look up.
+
+        Returns:
+            List of CachedImage objects, in save order.
+        """
+        return [
+            self._cache[ref]
+            for ref in self._by_tool_call.get(tool_call_id, ())
+            if ref in self._cache
+        ]
+
+    def delete_image(self, image_ref: str) -> bool:
+        """Delete a cached image and its file.
+
+        Args:
+            image_ref: The image reference to delete.
+
+        Returns:
+            True if the image was removed, False if it was not cached.
+        """
+        with self._mu:
+            cached = self._cache.pop(image_ref, None)
+            if cached is None:
+                return False
+            self._drop_ref(cached)
+            self._drop_b64(cached)
+            self._close_mapping(cached)
+            self._disk_index.pop(image_ref, None)
+            self._verified.discard(image_ref)
+        try:
+            os.unlink(cached.file_path)
+        except FileNotFoundError:
+            # Already gone (e.g. removed by a concurrent cleanup sweep).
+            pass
+        except OSError as e:
+            logger.error(f"Failed to delete cached image {cached.file_path}: {e}")
+            return False
+        return True
+
+    def _drop_ref(self, cached: CachedImage) -> None:
+        """Remove a cache entry from the tool-call index."""
+        refs = self._by_tool_call.get(cached.tool_call_id)
+        if refs is None:
+            return
+        try:
+            refs.remove(cached.image_ref)
+        except ValueError:
+            pass
+        if not refs:
+            self._by_tool_call.pop(cached.tool_call_id, None)
 
     def get_image_base64_by_path(
         self, file_path: str, mime_type: str = "image/png"
@@ -120,18 +364,163 @@ class ToolImageCache:
         Returns:
             Tuple of (base64_data, mime_type) if found, None otherwise.
         """
+        # Delegate to the memoizing ref-based accessor when this path is a
+        # registry-tracked cache file, so repeat reads skip the re-encode.
+        image_ref = os.path.splitext(os.path.basename(file_path))[0]
+        cached = self.get_image(image_ref)
+        if cached is not None and cached.file_path == file_path:
+            result = self.get_image_base64(image_ref)
+            if result is not None:
+                return result[0], mime_type
+
         if not os.path.exists(file_path):
             return None
+        base64_data = self._encode_file(file_path)
+        if base64_data is None:
+            return None
+        return base64_data, mime_type
+
+    def get_image_base64(self, image_ref: str) -> tuple[str, str] | None:
+        """Return the base64 payload and MIME type for a cached image.
+
+        Repeat calls for the same image return the memoized payload;
+        total memoized bytes are bounded by B64_CACHE_MAX_BYTES with
+        least-recently-used eviction.
+
+        Args:
+            image_ref: The image reference ("{tool_call_id}_{index}").
+
+        Returns:
+            Tuple of (base64_data, mime_type) if found, None otherwise.
+        """
+        cached = self.get_image(image_ref)
+        if cached is None:
+            return None
+        # The hit path takes the lock: the cleanup thread can evict or
+        # delete this ref concurrently, so the payload check and the LRU
+        # bump must be atomic.
+        with self._mu:
+            if cached.cached_b64 is not None:
+                if image_ref in self._b64_lru:
+                    self._b64_lru.move_to_end(image_ref)
+                return cached.cached_b64, cached.mime_type
+
+        base64_data = self._encode_file(cached.file_path)
+        if base64_data is None:
+            return None
+        with self._mu:
+            self._memoize_b64(cached, base64_data)
+        return base64_data, cached.mime_type
+
+    def get_image_bytes(self, image_ref: str) -> tuple[memoryview, str] | None:
+        """Return the raw image bytes and MIME type for a cached image.
+
+        The file is memory-mapped read-only and the mapping is kept on the
+        entry, so callers that can consume binary directly (e.g. platforms
+        that accept raw uploads) skip the base64 encode+decode round trip.
+
+        Args:
+            image_ref: The image reference ("{tool_call_id}_{index}").
+
+        Returns:
+            Tuple of (memoryview over the file contents, mime_type) if
+            found, None otherwise. The view is only valid while the image
+            stays cached.
+        """
+        cached = self.get_image(image_ref)
+        if cached is None:
+            return None
+        if cached.mapped is not None and not cached.mapped.closed:
+            return memoryview(cached.mapped), cached.mime_type
+
+        try:
+            fd = os.open(cached.file_path, os.O_RDONLY)
+            try:
+                cached.mapped = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+        except ValueError:
+            # Zero-length files cannot be mapped.
+            return memoryview(b""), cached.mime_type
+        except OSError as e:
+            logger.error(f"Failed to map cached image {cached.file_path}: {e}")
+            return None
+        return memoryview(cached.mapped), cached.mime_type
+
+    def _close_mapping(self, cached: CachedImage) -> None:
+        """Close an entry's memory map, if any."""
+        if cached.mapped is None:
+            return
+        try:
+            cached.mapped.close()
+        except BufferError:
+            # A caller still holds an exported view; the mapping is
+            # released once that view is dropped.
+            pass
+        cached.mapped = None
 
+    def _encode_file(self, file_path: str) -> str | None:
+        """Base64-encode a file's contents, streaming in bounded chunks."""
         try:
-            with open(file_path, "rb") as f:
-                image_bytes = f.read()
-            base64_data = base64.b64encode(image_bytes).decode("utf-8")
-            return base64_data, mime_type
+            # Preallocate the output buffer from the file size (4 base64
+            # chars per 3 bytes) and fill it chunk by chunk, instead of
+            # collecting per-chunk bytes and paying a full-size join copy.
+            # Reads go through readinto on an unbuffered file into a
+            # reusable buffer, so no per-chunk bytes objects are allocated.
+            size = os.path.getsize(file_path)
+            out = bytearray(-(-size // 3) * 4)
+            pos = 0
+            with self._encode_mu:
+                view = memoryview(self._read_buf)
+                with open(file_path, "rb", buffering=0) as f:
+                    while True:
+                        # Fill the whole buffer (raw reads may return
+                        # short) so every non-final chunk stays a
+                        # multiple of 3 bytes.
+                        filled = 0
+                        while filled < _RAW_CHUNK_SIZE:
+                            n = f.readinto(view[filled:])
+                            if not n:
+                                break
+                            filled += n
+                        if not filled:
+                            break
+                        encoded = _b64encode(view[:filled])
+                        out[pos : pos + len(encoded)] = encoded
+                        pos += len(encoded)
+                        if filled < _RAW_CHUNK_SIZE:
+                            break
+            if pos != len(out):
+                # File changed size between stat and read.
+                del out[pos:]
+            return out.decode("utf-8")
         except Exception as e:
             logger.error(f"Failed to read cached image {file_path}: {e}")
             return None
 
+    def _memoize_b64(self, cached: CachedImage, base64_data: str) -> None:
+        """Memoize an encoded payload, evicting LRU entries over the cap."""
+        cached.cached_b64 = base64_data
+        # Release any previous accounting for this ref (e.g. two threads
+        # encoded the same image concurrently) so the byte count never
+        # double-counts; reinsertion also lands the ref at the LRU tail.
+        self._b64_cache_bytes -= self._b64_lru.pop(cached.image_ref, 0)
+        self._b64_lru[cached.image_ref] = len(base64_data)
+        self._b64_cache_bytes += len(base64_data)
+        while self._b64_cache_bytes > self.B64_CACHE_MAX_BYTES and self._b64_lru:
+            old_ref, old_size = self._b64_lru.popitem(last=False)
+            self._b64_cache_bytes -= old_size
+            old_entry = self._cache.get(old_ref)
+            if old_entry is not None:
+                old_entry.cached_b64 = None
+
+    def _drop_b64(self, cached: CachedImage) -> None:
+        """Release an entry's memoized payload, if any."""
+        if cached.cached_b64 is None:
+            return
+        cached.cached_b64 = None
+        self._b64_cache_bytes -= self._b64_lru.pop(cached.image_ref, 0)
+
     def cleanup_expired(self) -> int:
         """Clean up expired cached images.
 
@@ -141,22 +530,96 @@ class ToolImageCache:
         now = time.time()
         cleaned = 0
 
+        # Drop expired entries from the in-memory registry first. This
+        # runs on a worker thread while other threads save and look up
+        # images, so snapshot the registry under the lock before iterating.
+        with self._mu:
+            items = list(self._cache.items())
+        expired_refs = [
+            ref for ref, cached in items if now - cached.created_at > self.CACHE_EXPIRY
+        ]
+        for ref in expired_refs:
+            if self.delete_image(ref):
+                cleaned += 1
+
+        # Then sweep the cache dir for orphaned files (e.g. left over from
+        # a previous process). Collect first, delete after, so the directory
+        # is not mutated while being scanned. Entries that survived the
+        # in-memory pass are fresh by construction, so their files can be
+        # skipped without another stat.
+        with self._mu:
+            known = {
+                os.path.basename(cached.file_path) for cached in self._cache.values()
+            }
+        to_delete: list[tuple[str, str]] = []
         try:
-            for file_name in os.listdir(self._cache_dir):
-                file_path = os.path.join(self._cache_dir, file_name)
-                if os.path.isfile(file_path):
-                    file_age = now - os.path.getmtime(file_path)
+            with os.scandir(self._cache_dir) as entries:
+                for entry in entries:
+                    if entry.name in known:
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    file_age = now - entry.stat(follow_symlinks=False).st_mtime
                     if file_age > self.CACHE_EXPIRY:
-                        os.remove(file_path)
-                        cleaned += 1
+                        to_delete.append((entry.path, entry.name))
         except Exception as e:
             logger.warning(f"Error during cache cleanup: {e}")
 
+        for file_path, file_name in to_delete:
+            try:
+                os.unlink(file_path)
+            except FileNotFoundError:
+                # Already removed by a concurrent sweep.
+                continue
+            except OSError as e:
+                logger.warning(f"Failed to delete expired image {file_path}: {e}")
+                continue
+            self._disk_index.pop(os.path.splitext(file_name)[0], None)
+            cleaned += 1
+
         if cleaned:
             logger.info(f"Cleaned up {cleaned} expired cached images")
 
         return cleaned
 
+    async def cleanup_expired_async(self) -> int:
+        """Run cleanup_expired in a worker thread.
+
+        File-system traversal and deletion are blocking operations; this
+        keeps them off the event loop.
+
+        Returns:
+            Number of images cleaned up.
+        """
+        return await asyncio.to_thread(self.cleanup_expired)
+
+    async def run_periodic_cleanup(self) -> None:
+        """Sweep for expired images every CLEANUP_INTERVAL_SECONDS until stopped."""
+        self._cleanup_stop.clear()
+        logger.info(
+            f"ToolImageCache periodic cleanup started. "
+            f"interval={self.CLEANUP_INTERVAL_SECONDS}s"
+        )
+        while not self._cleanup_stop.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._cleanup_stop.wait(),
+                    timeout=self.CLEANUP_INTERVAL_SECONDS,
+                )
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.cleanup_expired_async()
+            except Exception as e:
+                logger.error(f"Tool image cache cleanup failed: {e}", exc_info=True)
+
+        logger.info("ToolImageCache periodic cleanup stopped.")
+
+    async def stop_periodic_cleanup(self) -> None:
+        self._cleanup_stop.set()
+
 
 # Global singleton instance
 tool_image_cache = ToolImageCache()
@@ -18,6 +18,7 @@ from asyncio import Queue
 
 from astrbot.api import logger, sp
 from astrbot.core import LogBroker, LogManager
+from astrbot.core.agent.tool_image_cache import tool_image_cache
 from astrbot.core.astrbot_config_mgr import AstrBotConfigManager
 from astrbot.core.config.default import VERSION
 from astrbot.core.conversation_mgr import ConversationManager
@@ -252,6 +253,10 @@ class AstrBotCoreLifecycle:
                 self.temp_dir_cleaner.run(),
                 name="temp_dir_cleaner",
             )
+        tool_image_cleanup_task = asyncio.create_task(
+            tool_image_cache.run_periodic_cleanup(),
+            name="tool_image_cache_cleanup",
+        )
 
         # 把插件中注册的所有协程函数注册到事件总线中并执行
         extra_tasks = []
@@ -263,6 +268,7 @@ class AstrBotCoreLifecycle:
             tasks_.append(cron_task)
         if temp_dir_cleaner_task:
             tasks_.append(temp_dir_cleaner_task)
+        tasks_.append(tool_image_cleanup_task)
         for task in tasks_:
             self.curr_tasks.append(
                 asyncio.create_task(self._task_wrapper(task), name=task.get_name()),
@@ -316,6 +322,7 @@ class AstrBotCoreLifecycle:
         """停止 AstrBot 核心生命周期管理类, 取消所有当前任务并终止各个管理器."""
         if self.temp_dir_cleaner:
             await self.temp_dir_cleaner.stop()
+        await tool_image_cache.stop_periodic_cleanup()
 
         # 请求停止所有正在运行的异步任务
         for task in self.curr_tasks:
@@ -0,0 +1,214 @@
+"""Tests for ToolImageCache save/lookup/cleanup behavior."""
+
+import base64
+import os
+
+import pytest
+
+from astrbot.core.agent import tool_image_cache as tic_module
+from astrbot.core.agent.tool_image_cache import ToolImageCache
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+PNG_B64 = base64.b64encode(PNG_BYTES).decode()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(tic_module, "get_astrbot_temp_path", lambda: str(tmp_path))
+    monkeypatch.setattr(ToolImageCache, "_instance", None)
+    yield ToolImageCache()
+
+
+class TestSaveAndRetrieve:
+    def test_save_writes_decoded_file(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        assert cached.image_ref == "call_1_0"
+        with open(cached.file_path, "rb") as f:
+            assert f.read() == PNG_BYTES
+
+    def test_get_image_base64_by_path_roundtrip(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        result = cache.get_image_base64_by_path(cached.file_path, cached.mime_type)
+        assert result is not None
+        base64_data, mime_type = result
+        assert base64.b64decode(base64_data) == PNG_BYTES
+        assert mime_type == "image/png"
+
+    def test_get_image_base64_by_path_missing(self, cache):
+        assert cache.get_image_base64_by_path("/nonexistent/x.png") is None
+
+    def test_save_strips_data_url_prefix(self, cache):
+        cached = cache.save_image(
+            f"data:image/png;base64,{PNG_B64}", "call_1", "test_tool"
+        )
+        with open(cached.file_path, "rb") as f:
+            assert f.read() == PNG_BYTES
+
+    def test_save_rejects_bad_length(self, cache):
+        with pytest.raises(ValueError, match="multiple of 4"):
+            cache.save_image(PNG_B64 + "x", "call_1", "test_tool")
+
+    def test_save_accepts_mime_wrapped_base64(self, cache):
+        # Payload large enough to span several decode chunks, wrapped at
+        # 76 chars so whitespace lands mid-stream. Pad the line count so
+        # the wrapped length is a multiple of 4 and sails past the cheap
+        # length check.
+        data = bytes(range(256)) * 800
+        b64 = base64.b64encode(data).decode()
+        wrapped = "\n".join(b64[i : i + 76] for i in range(0, len(b64), 76))
+        wrapped += "\n" * (-len(wrapped) % 4)
+        assert len(wrapped) % 4 == 0
+        cached = cache.save_image(wrapped, "call_1", "test_tool")
+        with open(cached.file_path, "rb") as f:
+            assert f.read() == data
+
+
+class TestGetImage:
+    def test_get_image_hit(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        assert cache.get_image("call_1_0") is cached
+
+    def test_get_image_unknown(self, cache):
+        assert cache.get_image("missing_0") is None
+
+    def test_get_image_recovers_from_disk(self, cache):
+        file_path = os.path.join(cache._cache_dir, "call_9_0.jpg")
+        with open(file_path, "wb") as f:
+            f.write(PNG_BYTES)
+        cached = cache.get_image("call_9_0")
+        assert cached is not None
+        assert cached.tool_call_id == "call_9"
+        assert cached.mime_type == "image/jpeg"
+        assert cache.list_images_by_tool_call("call_9") == [cached]
+
+    def test_get_image_trusts_self_written_files(self, cache):
+        # Refs saved by this process skip the existence probe entirely.
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        os.remove(cached.file_path)
+        assert cache.get_image("call_1_0") is cached
+
+    def test_get_image_stale_unverified_entry_dropped(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        cache._verified.discard("call_1_0")
+        os.remove(cached.file_path)
+        assert cache.get_image("call_1_0") is None
+        assert cache.list_images_by_tool_call("call_1") == []
+
+
+class TestToolCallIndex:
+    def test_list_images_by_tool_call(self, cache):
+        first = cache.save_image(PNG_B64, "call_1", "test_tool", index=0)
+        second = cache.save_image(PNG_B64, "call_1", "test_tool", index=1)
+        cache.save_image(PNG_B64, "call_2", "test_tool")
+        assert cache.list_images_by_tool_call("call_1") == [first, second]
+
+    def test_list_images_unknown_tool_call(self, cache):
+        assert cache.list_images_by_tool_call("missing") == []
+
+    def test_delete_image_updates_index(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        assert cache.delete_image(cached.image_ref) is True
+        assert not os.path.exists(cached.file_path)
+        assert cache.list_images_by_tool_call("call_1") == []
+
+    def test_delete_unknown_image(self, cache):
+        assert cache.delete_image("missing_0") is False
+
+
+class TestBase64Memoization:
+    def test_repeat_call_reuses_payload(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        first = cache.get_image_base64("call_1_0")
+        assert first == (PNG_B64, "image/png")
+        # Rewrite the file; a memoized second call must not re-read it.
+        with open(cached.file_path, "wb") as f:
+            f.write(b"changed")
+        assert cache.get_image_base64("call_1_0") == first
+
+    def test_get_image_base64_unknown(self, cache):
+        assert cache.get_image_base64("missing_0") is None
+
+    def test_by_path_uses_memoized_payload(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        cache.get_image_base64("call_1_0")
+        result = cache.get_image_base64_by_path(cached.file_path, cached.mime_type)
+        assert result == (PNG_B64, "image/png")
+
+    def test_lru_eviction_respects_cap(self, cache, monkeypatch):
+        monkeypatch.setattr(ToolImageCache, "B64_CACHE_MAX_BYTES", len(PNG_B64) + 10)
+        cache.save_image(PNG_B64, "call_1", "test_tool")
+        cache.save_image(PNG_B64, "call_2", "test_tool")
+        cache.get_image_base64("call_1_0")
+        cache.get_image_base64("call_2_0")
+        # call_1's payload no longer fits and must have been evicted.
+        assert cache.get_image("call_1_0").cached_b64 is None
+        assert cache.get_image("call_2_0").cached_b64 == PNG_B64
+
+    def test_rememoize_does_not_double_count(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        cache.get_image_base64("call_1_0")
+        # Simulate two threads racing to encode the same image: the payload
+        # is re-memoized while the LRU already holds an entry for the ref.
+        cached.cached_b64 = None
+        cache.get_image_base64("call_1_0")
+        assert cache._b64_cache_bytes == len(PNG_B64)
+
+    def test_delete_releases_memoized_bytes(self, cache):
+        cache.save_image(PNG_B64, "call_1", "test_tool")
+        cache.get_image_base64("call_1_0")
+        assert cache._b64_cache_bytes == len(PNG_B64)
+        cache.delete_image("call_1_0")
+        assert cache._b64_cache_bytes == 0
+
+
+class TestGetImageBytes:
+    def test_returns_raw_bytes(self, cache):
+        cache.save_image(PNG_B64, "call_1", "test_tool")
+        result = cache.get_image_bytes("call_1_0")
+        assert result is not None
+        view, mime_type = result
+        assert bytes(view) == PNG_BYTES
+        assert mime_type == "image/png"
+        view.release()
+
+    def test_mapping_reused(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        cache.get_image_bytes("call_1_0")[0].release()
+        mapping = cached.mapped
+        cache.get_image_bytes("call_1_0")[0].release()
+        assert cached.mapped is mapping
+
+    def test_unknown_image(self, cache):
+        assert cache.get_image_bytes("missing_0") is None
+
+    def test_delete_closes_mapping(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        cache.get_image_bytes("call_1_0")[0].release()
+        mapping = cached.mapped
+        cache.delete_image("call_1_0")
+        assert mapping.closed
+
+
+class TestCleanup:
+    def test_cleanup_removes_expired_entries(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        cached.created_at -= ToolImageCache.CACHE_EXPIRY + 1
+        assert cache.cleanup_expired() == 1
+        assert not os.path.exists(cached.file_path)
+        assert cache.list_images_by_tool_call("call_1") == []
+
+    def test_cleanup_keeps_fresh_entries(self, cache):
+        cached = cache.save_image(PNG_B64, "call_1", "test_tool")
+        assert cache.cleanup_expired() == 0
+        assert os.path.exists(cached.file_path)
+
+    def test_cleanup_removes_orphan_files(self, cache):
+        orphan = os.path.join(cache._cache_dir, "orphan_0.png")
+        with open(orphan, "wb") as f:
+            f.write(PNG_BYTES)
+        old = cache.CACHE_EXPIRY + 10
+        os.utime(
+            orphan, (os.path.getatime(orphan) - old, os.path.getmtime(orphan) - old)
+        )
+        assert cache.cleanup_expired() == 1
+        assert not os.path.exists(orphan)